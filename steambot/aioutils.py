@@ -3,6 +3,7 @@
 import asyncio
 import functools
 import logging
+import os
 import sys
 import threading
 import time
@@ -14,7 +15,7 @@ from asyncio import (
 )
 from concurrent.futures.thread import ThreadPoolExecutor
 from pathlib import Path
-from threading import Thread, Condition, Lock
+from threading import Thread, Event
 from typing import (
     Coroutine,
     Optional,
@@ -32,7 +33,12 @@ LOGGER = logging.getLogger(__name__)
 UNACCEPTABLE_CALL_DURATION = 0.2
 TICKER_DELAY = 2.5
 
-_THREAD_POOL_EXECUTOR = ThreadPoolExecutor(thread_name_prefix="run_in_thread")
+# Threads mostly wait on the Steam API, so size the pool well above the CPU count
+THREAD_POOL_SIZE = int(os.environ.get("STEAMBOT_THREADS", "64"))
+
+_THREAD_POOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=THREAD_POOL_SIZE, thread_name_prefix="run_in_thread"
+)
 
 
 T = TypeVar("T")  # pylint: disable=invalid-name
@@ -42,8 +48,10 @@ async def run_in_thread(func: Callable[..., T], *args, **kwargs) -> T:
     """Run a callable in a thread and return the result"""
     assert callable(func), f"{func} is not callable"
 
+    if kwargs:
+        func = functools.partial(func, **kwargs)
     return await asyncio.get_running_loop().run_in_executor(
-        _THREAD_POOL_EXECUTOR, functools.partial(func, *args, **kwargs)
+        _THREAD_POOL_EXECUTOR, func, *args
     )
 
 
@@ -76,7 +84,7 @@ class StallingEventLoopWatchdog:
         self._loop_ticker: Optional[TimerHandle] = None
         self._loop_thread_id: Optional[int] = None
         self._loop_ticker_timestamp = 0
-        self._cond = Condition(Lock())
+        self._wake = Event()
         self._stalled_in_debugger = False
         self._watchdog_thread: Optional[Thread] = None
         self._stopped = True
@@ -91,34 +99,8 @@ class StallingEventLoopWatchdog:
         self._watchdog_thread = Thread(
             target=self._watchdog_loop,
             daemon=daemon,
-            name=f"aiowatchdog-{self._get_watchdog_id()}",
         )
 
-    @staticmethod
-    async def _get_thread_id() -> Optional[int]:
-        return getattr(asyncio.get_running_loop(), "_thread_id")
-
-    def _set_loop_thread_id(self, thread_id: Optional[int]):
-        self._loop_thread_id = thread_id
-
-    def _get_watchdog_id(self) -> str:
-        if self._loop.is_running():
-            asyncio.run_coroutine_threadsafe(
-                self._get_thread_id(), self._loop
-            ).add_done_callback(lambda f: self._set_loop_thread_id(f.result()))
-        else:
-            self._set_loop_thread_id(
-                self._loop.run_until_complete(self._get_thread_id())
-            )
-
-        loop_thread_id = getattr(self._loop, "_thread_id", self._loop_thread_id)
-        threads = [t for t in threading.enumerate() if t.ident == loop_thread_id]
-
-        if not threads:
-            return str(id(self._loop))
-
-        return threads[0].name
-
     @property
     def running(self) -> bool:
         """is watchdog running"""
@@ -133,7 +115,9 @@ class StallingEventLoopWatchdog:
             "Starting aiowatchdog for %s...", self._loop_thread_id or no_thread_msg
         )
         self._stopped = False
+        # The first tick runs here on the loop's thread, recording its thread ID
         self._ticker_loop()
+        self._watchdog_thread.name = f"aiowatchdog-{self._loop_thread_id}"
         self._watchdog_thread.start()
         LOGGER.debug(
             "Started aiowatchdog for %s!", self._loop_thread_id or no_thread_msg
@@ -143,9 +127,8 @@ class StallingEventLoopWatchdog:
         """
         Stop event loop watchdog
         """
-        with self._cond:
-            self._stopped = True
-            self._cond.notify()
+        self._stopped = True
+        self._wake.set()
         if self._loop_ticker and not self._loop_ticker.cancelled():
             self._loop_ticker.cancel()
 
@@ -153,9 +136,9 @@ class StallingEventLoopWatchdog:
         """
         Notify event loop watchdog about event loop iteration
         """
-        with self._cond:
-            self._loop_ticker_timestamp = time.monotonic()
-            self._counter += 1
+        # Only called from the event loop thread, so the watchdog never needs waking
+        self._loop_ticker_timestamp = time.monotonic()
+        self._counter += 1
 
     @property
     def ticker_time(self) -> float:
@@ -176,35 +159,29 @@ class StallingEventLoopWatchdog:
         self._loop.call_soon_threadsafe(self._ticker_loop)
 
         # Wake up the event stall watchdog to make sure the new ticker time is used
-        with self._cond:
-            self._cond.notify_all()
+        self._wake.set()
 
     def _watchdog_loop(self):
         """
         Watchdog thread routine
         """
-        self._watchdog_thread.setName(f"aiowatchdog-{self._loop_thread_id}")
         LOGGER.debug("Monitoring for event loop %s for stalls", self._loop_thread_id)
-        with self._cond:
-            while not self._stopped:
-                elapsed = 0
-                last_seen_counter = self._counter
-                start = time.monotonic()
-
-                # Wait for UNACCEPTABLE_LOOP_ITERATION_DURATION
-                # Wait again if woken up spuriously
-                while elapsed < self._ticker_time:
-                    self._cond.wait(self._ticker_time - elapsed)
-                    if self._loop.is_closed():
-                        if self._loop_ticker and not self._loop_ticker.cancelled():
-                            self._loop_ticker.cancel()
-                        return
-                    now = time.monotonic()
-                    elapsed = now - start
-
-                if last_seen_counter == self._counter:
-                    self._stall_counter_ids.add(self._counter)
-                    self._dump_reactor_stacktrace(now)
+        while not self._stopped:
+            last_seen_counter = self._counter
+
+            # Wait for the ticker time, only stop/set_ticker_time wake us early
+            woken = self._wake.wait(self._ticker_time)
+            if self._loop.is_closed():
+                if self._loop_ticker and not self._loop_ticker.cancelled():
+                    self._loop_ticker.cancel()
+                return
+            if woken:
+                self._wake.clear()
+                continue
+
+            if last_seen_counter == self._counter:
+                self._stall_counter_ids.add(self._counter)
+                self._dump_reactor_stacktrace(time.monotonic())
 
     @property
     def stall_count(self) -> int:
@@ -242,46 +219,43 @@ class StallingEventLoopWatchdog:
         Dump reactor thread stacktrace
         """
 
-        for thread_id, stack in sys._current_frames().items():
-            loop_thread_id = getattr(self._loop, "_thread_id", self._loop_thread_id)
-
-            if thread_id != loop_thread_id:
-                continue
-
-            stalled_traceback = traceback.extract_stack(stack)
-            if self.is_paused_in_pydevd(stalled_traceback):
-                if not self._stalled_in_debugger:
-                    LOGGER.warning("Event loop paused in debugger")
-                self._stalled_in_debugger = True
-                return
-
-            if self._stalled_in_debugger:
-                self._stalled_in_debugger = False
-
-            trace = ["Traceback (most recent call last):"]
-            if stalled_traceback is not None:
-                for filename, lineno, name, line in stalled_traceback:
-                    trace.append(
-                        '  File "%s", line %d, in %s' % (filename, lineno, name)
-                    )
-                    if line:
-                        trace.append("    %s" % (line.strip()))
-            traceback_string = "\n".join(trace) + "\nEventLoopStallingException"
-
-            time_since_loop_ticker = now - self._loop_ticker_timestamp
-            if time_since_loop_ticker <= 0:
-                return
-            LOGGER.error(
-                (
-                    "Event Loop stalling!\n"
-                    "Time since event loop ticker was called: %.3f\n"
-                    "Event Loop Thread: %s\n"
-                    "%s\n"
-                ),
-                time_since_loop_ticker,
-                thread_id,
-                traceback_string,
-            )
+        thread_id = getattr(self._loop, "_thread_id", self._loop_thread_id)
+        stack = sys._current_frames().get(thread_id)
+        if stack is None:
+            return
+
+        stalled_traceback = traceback.extract_stack(stack)
+        if self.is_paused_in_pydevd(stalled_traceback):
+            if not self._stalled_in_debugger:
+                LOGGER.warning("Event loop paused in debugger")
+            self._stalled_in_debugger = True
+            return
+
+        if self._stalled_in_debugger:
+            self._stalled_in_debugger = False
+
+        trace = ["Traceback (most recent call last):"]
+        if stalled_traceback is not None:
+            for filename, lineno, name, line in stalled_traceback:
+                trace.append('  File "%s", line %d, in %s' % (filename, lineno, name))
+                if line:
+                    trace.append("    %s" % (line.strip()))
+        traceback_string = "\n".join(trace) + "\nEventLoopStallingException"
+
+        time_since_loop_ticker = now - self._loop_ticker_timestamp
+        if time_since_loop_ticker <= 0:
+            return
+        LOGGER.error(
+            (
+                "Event Loop stalling!\n"
+                "Time since event loop ticker was called: %.3f\n"
+                "Event Loop Thread: %s\n"
+                "%s\n"
+            ),
+            time_since_loop_ticker,
+            thread_id,
+            traceback_string,
+        )
 
     def _ticker_loop(self):
         """
@@ -329,17 +303,24 @@ _SLOW_CALL_LOOPS: Set[AbstractEventLoop] = set()
 def _run_with_time(_run):
     """wrapper to time how long a coro takes to run and warn if it too took long"""
 
+    monotonic = time.monotonic
+
     @functools.wraps(_run)
     def _wrapper(self):
-        start_time = time.monotonic()
+        # Runs for every callback, so skip timing entirely when nothing is monitored
+        if not _SLOW_CALL_LOOPS:
+            return _run(self)
+        start_time = monotonic()
         try:
             return _run(self)
         finally:
-            if asyncio.get_running_loop() in _SLOW_CALL_LOOPS:
-                # only log if the running loop is being monitored
-                delta_time = time.monotonic() - start_time
-                if delta_time >= UNACCEPTABLE_CALL_DURATION:
-                    _log_blocking_call(self, delta_time)
+            delta_time = monotonic() - start_time
+            # only log if the running loop is being monitored
+            if (
+                delta_time >= UNACCEPTABLE_CALL_DURATION
+                and asyncio.get_running_loop() in _SLOW_CALL_LOOPS
+            ):
+                _log_blocking_call(self, delta_time)
 
     return _wrapper
 
@@ -356,13 +337,17 @@ def _unhandled_exception_handler(_loop: AbstractEventLoop, context: Dict[str, An
 def _install_slow_coro_patch(loop: Optional[AbstractEventLoop]):
     loop = loop or asyncio.get_event_loop()
     loop.slow_callback_duration = UNACCEPTABLE_CALL_DURATION
+    if not isinstance(loop, asyncio.BaseEventLoop):
+        # e.g. uvloop runs its own handles, so the Handle._run patch never fires
+        LOGGER.info("Slow coroutine handler not supported by %s", type(loop).__name__)
+        return
     _SLOW_CALL_LOOPS.add(loop)
     LOGGER.info("Installed slow coroutine handler")
 
 
 def _remove_slow_coro_patch(loop: Optional[AbstractEventLoop]):
     loop = loop or asyncio.get_event_loop()
-    _SLOW_CALL_LOOPS.remove(loop)
+    _SLOW_CALL_LOOPS.discard(loop)
     LOGGER.info("Uninstalled slow coroutine handler")
 
 
@@ -413,6 +398,8 @@ def _set_loop_debug(loop_debug: bool, loop: Optional[AbstractEventLoop] = None):
 def install(loop: AbstractEventLoop = None, loop_debug: bool = False):
     """Install asyncio debugging utils"""
     LOGGER.info("Installing Event Loop utilities...")
+    # Share one pool between run_in_thread and run_in_executor(None, ...)
+    (loop or asyncio.get_event_loop()).set_default_executor(_THREAD_POOL_EXECUTOR)
     _install_unhandled_exception_handler(loop)
     _install_slow_coro_patch(loop)
     _install_stall_watchdog(loop)
@@ -2,36 +2,90 @@ import asyncio
 import contextlib
 import logging
 import os
+import time
 from collections import defaultdict
 from datetime import timedelta, datetime
-from math import ceil
-from typing import Sequence, Mapping, Tuple, Optional, Union
+from typing import (
+    Sequence,
+    Mapping,
+    Tuple,
+    Optional,
+    Union,
+    Dict,
+    List,
+    Callable,
+    Collection,
+    TypeVar,
+    Iterator,
+    ContextManager,
+)
 
 import discord
 import sqlalchemy as sa
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy import func
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session, selectinload
 from steamapi.core import APIConnection
-from steamapi.user import SteamUser, UserNotFoundError
+from steamapi.user import UserNotFoundError
 
 from steambot import search
-from steambot.aioutils import run_in_thread
-from steambot.models import Base, Guild, User
-from steambot.search import STEAM_ID_REGEX
+from steambot.aioutils import run_in_thread, dump_gathered_exceptions
+from steambot.models import Base, Guild, User, VanityURL, migrate
 
 LOGGER = logging.getLogger(__name__)
 
+T = TypeVar("T")  # pylint: disable=invalid-name
+
 THUMBS_UP_EMOJI = "👍"
 THUMBS_DOWN_EMOJI = "👎"
 
+EMBED_MAX_FIELDS = 25
+
+SQLITE_MAX_PARAMETERS = 999
+
+SteamUserInfo = Tuple[int, str, Optional[datetime]]
+GuildConfig = Tuple[str, Optional[int]]
+
+
+def _batches(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _profile_links(user_id: int) -> str:
+    return f"""\
+[View their profile on Steam](https://steamcommunity.com/profiles/{user_id})
+[View their profile on CSGO Stats](https://csgostats.gg/player/{user_id})
+"""
 
-class BanChecker(discord.Client):
+
+class BanChecker(discord.Client):  # pylint: disable=too-many-instance-attributes
 
     CHECK_INTERVAL = 24
     """Number of times per day to check for bans"""
 
+    STEAM_USER_CACHE_TTL = 3600
+    """Number of seconds a Steam user lookup is re-used for"""
+
+    VANITY_URL_TTL = 7 * 24 * 3600
+    """Number of seconds a resolved vanity URL is re-used for"""
+
+    GUILD_CONFIG_CACHE_TTL = 60
+    """Number of seconds a guild's command and channel are cached for"""
+
+    STEAM_API_CONCURRENCY = 8
+    """Maximum number of concurrent Steam API lookups"""
+
+    STEAM_API_BATCH_SIZE = 100
+    """Maximum number of Steam IDs per batched Steam API call"""
+
+    DISCORD_SEND_CONCURRENCY = 5
+    """Maximum number of concurrent ban notifications being sent"""
+
+    MISSED_MESSAGE_CONCURRENCY = 32
+    """Maximum number of missed messages being processed at once per guild"""
+
     def __init__(self, db_path: str, steam_token: str, discord_token: str) -> None:
         super().__init__()
         self._steam_token = steam_token
@@ -42,22 +96,49 @@ class BanChecker(discord.Client):
         engine = sa.create_engine(f"sqlite:///{db_path}")
         if create_schema:
             LOGGER.info('Message="Creating database schema"')
-            Base.metadata.create_all(engine)
+        # Only creates missing tables, so existing databases pick up new tables
+        Base.metadata.create_all(engine)
+        migrate(engine)
         self._db = sessionmaker(bind=engine)
         self.steam_api = APIConnection(api_key=steam_token, validate_key=True)
         self._scheduler: AsyncIOScheduler = AsyncIOScheduler()
+        self._steam_user_cache: Dict[int, Tuple[float, SteamUserInfo]] = {}
+        self._steam_api_semaphore = asyncio.Semaphore(self.STEAM_API_CONCURRENCY)
+        self._guild_cache: Dict[int, Tuple[float, GuildConfig]] = {}
+        self._discord_send_semaphore = asyncio.Semaphore(self.DISCORD_SEND_CONCURRENCY)
 
         self._command_map = {
-            "list": self.send_stats
+            "list": self.send_stats,
+            "stats": self.send_stats,
         }
 
-    @contextlib.contextmanager
-    def _session(self):
-        session = self._db()
-        try:
-            yield session
-        finally:
-            session.close()
+    def _session(self) -> ContextManager[Session]:
+        # SQLAlchemy 1.3 sessions aren't context managers, closing() is the
+        # lightest way to close them on exit
+        return contextlib.closing(self._db())
+
+    def _get_guild_config(self, guild_id: int) -> Optional[GuildConfig]:
+        """
+        Get a guild's (command, channel), re-reading it from the database once the
+        cached copy is older than GUILD_CONFIG_CACHE_TTL. The config is only
+        edited in the database, so this is how those edits are picked up.
+        """
+        now = time.monotonic()
+        cached = self._guild_cache.get(guild_id)
+        if cached is not None and now - cached[0] < self.GUILD_CONFIG_CACHE_TTL:
+            return cached[1]
+        with self._session() as session:
+            config = (
+                session.query(Guild.command, Guild.channel)
+                .filter(Guild.id == guild_id)
+                .one_or_none()
+            )
+        if config is None:
+            self._guild_cache.pop(guild_id, None)
+            return None
+        config = tuple(config)
+        self._guild_cache[guild_id] = (now, config)
+        return config
 
     def run(self):
         self._scheduler.add_job(
@@ -78,6 +159,14 @@ class BanChecker(discord.Client):
                 type=discord.ActivityType.watching,
             )
         )
+        now = time.monotonic()
+        with self._session() as session:
+            self._guild_cache = {
+                guild_id: (now, (command, channel))
+                for guild_id, command, channel in session.query(
+                    Guild.id, Guild.command, Guild.channel
+                )
+            }
         user_ids = await self.find_missed_user_ids()
         await self.process_user_ids(user_ids)
 
@@ -87,30 +176,50 @@ class BanChecker(discord.Client):
         with self._session() as session:
             session.add(db_guild)
             session.commit()
+            self._guild_cache[guild.id] = (
+                time.monotonic(),
+                (db_guild.command, db_guild.channel),
+            )
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        LOGGER.info('Message="Left guild" ID="%s" Name="%s"', guild.id, guild.name)
+        self._guild_cache.pop(guild.id, None)
 
     async def on_message(self, message: discord.Message):
-        with self._session() as session:
-            db_guild = (
-                session.query(Guild).filter(Guild.id == message.guild.id).one_or_none()
+        if message.guild is None:
+            return
+        if (guild_config := self._get_guild_config(message.guild.id)) is None:
+            LOGGER.debug(
+                'Message="Ignoring message, guild not registered" GuildID="%s"',
+                message.guild.id,
             )
-        if db_guild.channel is not None and db_guild.channel != message.channel.id:
+            return
+        command, channel = guild_config
+        if channel is not None and channel != message.channel.id:
             LOGGER.debug(
                 'Message="Ignoring message, not monitoring channel" Channel="%s" MonitoredChannel="%s"',
                 message.channel.id,
-                db_guild.channel,
+                channel,
             )
             return
-        if message.content.startswith(db_guild.command):
-            await self.dispatch_command(message)
+        if message.content.startswith(command):
+            await self.dispatch_command(message, command)
             return
 
-        user_ids = await self.get_user_ids_from_message(message, db_guild.command)
+        user_ids = await self.get_user_ids_from_message(
+            message, command, is_command=False
+        )
         LOGGER.debug('Message="Found user IDs" Count="%s"', len(user_ids))
         await self.process_user_ids({u: [message.guild.id] for u in user_ids})
 
-    async def dispatch_command(self, message: discord.Message):
-        if message.content[1:].startswith("stats"):
-            await self.send_stats(message.guild.id)
+    async def dispatch_command(self, message: discord.Message, command: str):
+        args = message.content[len(command) :].split(maxsplit=1)
+        if not args or (handler := self._command_map.get(args[0])) is None:
+            LOGGER.debug(
+                'Message="Ignoring unknown command" Content="%s"', message.content
+            )
+            return
+        await handler(message.guild.id)
 
     async def find_missed_user_ids(
         self, guild: discord.Guild = None
@@ -119,17 +228,29 @@ class BanChecker(discord.Client):
         if guild is None:
             results = defaultdict(list)
             data = await asyncio.gather(
-                *[self.find_missed_user_ids(s) for s in self.guilds]
+                *[self.find_missed_user_ids(s) for s in self.guilds],
+                return_exceptions=True,
             )
+            dump_gathered_exceptions("checking guilds for missed messages", data)
             for guild_data in data:
+                if isinstance(guild_data, BaseException):
+                    continue
                 for user_id, guild_ids in guild_data.items():
                     results[user_id].extend(guild_ids)
             return results
-        with self._session() as session:
-            db_guild = session.query(Guild).filter(Guild.id == guild.id).one_or_none()
-            if db_guild is None:
-                return {}
-        channel = guild.get_channel(db_guild.channel)
+        if (guild_config := self._get_guild_config(guild.id)) is None:
+            return {}
+        command, channel_id = guild_config
+        channel = None
+        if channel_id is not None:
+            channel = guild.get_channel(channel_id)
+        if channel is None:
+            LOGGER.info(
+                'Message="Guild has no monitored channel, skipping" GuildID="%s" Guild="%s"',
+                guild.id,
+                guild.name,
+            )
+            return {}
         LOGGER.info(
             'Message="Checking guild for missed messages" GuildID="%s" Guild="%s" ChannelID="%s" Channel="#%s"',
             guild.id,
@@ -137,18 +258,50 @@ class BanChecker(discord.Client):
             channel.id,
             channel.name,
         )
-        results = await asyncio.gather(
-            *[
-                self.get_user_ids_from_message(m, db_guild.command)
-                async for m in channel.history()
-            ]
-        )
-        user_ids = {user_id: [guild.id] for user_ids in results for user_id in user_ids}
+        user_ids = {
+            user_id: [guild.id]
+            for user_id in await self._get_user_ids_from_history(channel, command)
+        }
         LOGGER.debug('Message="Found missed user IDs" Count="%s"', len(user_ids))
         return user_ids
 
+    async def _get_user_ids_from_history(
+        self, channel: discord.TextChannel, command: str
+    ) -> List[str]:
+        """
+        Get the user IDs from a channel's history, streaming it through a bounded
+        window rather than holding a task for every message in the channel
+        """
+        user_ids: List[str] = []
+        pending = set()
+
+        def collect(done):
+            for task in done:
+                user_ids.extend(task.result())
+
+        try:
+            async for message in channel.history():
+                pending.add(
+                    asyncio.ensure_future(
+                        self.get_user_ids_from_message(message, command)
+                    )
+                )
+                if len(pending) >= self.MISSED_MESSAGE_CONCURRENCY:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    collect(done)
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                collect(done)
+        finally:
+            # Don't leave the rest of the window running unobserved if one raised
+            for task in pending:
+                task.cancel()
+        return user_ids
+
     async def get_user_ids_from_message(
-        self, message: discord.Message, command: str
+        self, message: discord.Message, command: str, is_command: bool = None
     ) -> Sequence[str]:
         if message is None:
             return []
@@ -157,64 +310,232 @@ class BanChecker(discord.Client):
         content = message.content
         if not content:
             return []
-        if content.startswith(command):
+        # on_message has already checked for the command prefix
+        if is_command is None:
+            is_command = content.startswith(command)
+        if is_command:
             return []
         for r in message.reactions:
             if r.me:
                 return []
         user_ids = search.find_user_ids_in_string(content)
-        await message.add_reaction(THUMBS_UP_EMOJI if user_ids else THUMBS_DOWN_EMOJI)
+        if user_ids:
+            await message.add_reaction(THUMBS_UP_EMOJI)
+        elif "://" in content:
+            # Only flag links we couldn't use, general chat doesn't need a reaction
+            await message.add_reaction(THUMBS_DOWN_EMOJI)
         return user_ids
 
     async def process_user_ids(self, user_ids: Mapping[str, Sequence[int]]):
-        results = await asyncio.gather(
-            *[self.process_user_id(u, g_ids) for u, g_ids in user_ids.items()],
+        if not user_ids:
+            return
+        known_vanity_urls = self._get_known_vanity_urls(user_ids)
+        steam_ids = await asyncio.gather(
+            *[self.resolve_user_id(known_vanity_urls.get(u, u)) for u in user_ids],
             return_exceptions=True,
         )
-        errors = [r for r in results if r is not None]
+        steam_users = await self.fetch_steam_users(
+            {s for s in steam_ids if not isinstance(s, BaseException)}
+        )
+
+        errors = 0
+        processed: Mapping[int, List[int]] = defaultdict(list)
+        new_vanity_urls: Dict[str, int] = {}
+        for (user_id, guild_ids), steam_id in zip(user_ids.items(), steam_ids):
+            if isinstance(steam_id, BaseException) or steam_id not in steam_users:
+                errors += 1
+                continue
+            processed[steam_id].extend(guild_ids)
+            if user_id not in known_vanity_urls and not search.is_steam_id(user_id):
+                new_vanity_urls[user_id] = steam_id
+
+        if processed:
+            with self._session() as session:
+                # Posted users get their current ban date stored without a
+                # notification, only the scheduled check notifies about new bans
+                self._store_users(
+                    session, [steam_users[u] for u in processed], processed
+                )
+                now = datetime.utcnow()
+                for vanity_url, steam_id in new_vanity_urls.items():
+                    session.merge(
+                        VanityURL(url=vanity_url, user_id=steam_id, date_resolved=now)
+                    )
+                # One transaction for the whole batch rather than one per user
+                session.commit()
+
         LOGGER.info(
             'Message="Processed user IDs" Count="%s" Errors="%s"',
-            len(results),
-            len(errors),
+            len(steam_ids),
+            errors,
         )
 
+    def _get_known_vanity_urls(self, user_ids: Collection[str]) -> Dict[str, int]:
+        """Get the Steam IDs of vanity URLs resolved within the last VANITY_URL_TTL
+
+        Custom URLs can be changed and then claimed by another account, so older
+        mappings are resolved again rather than trusted forever.
+        """
+        resolved_after = datetime.utcnow() - timedelta(seconds=self.VANITY_URL_TTL)
+        known_vanity_urls: Dict[str, int] = {}
+        with self._session() as session:
+            for batch in _batches(list(user_ids), SQLITE_MAX_PARAMETERS):
+                known_vanity_urls.update(
+                    session.query(VanityURL.url, VanityURL.user_id).filter(
+                        VanityURL.url.in_(batch),
+                        VanityURL.date_resolved >= resolved_after,
+                    )
+                )
+        return known_vanity_urls
+
     @staticmethod
-    def _get_steam_user(
-        user_id: Union[int, str]
-    ) -> Tuple[int, str, Optional[datetime]]:
+    def _resolve_vanity_url(vanity_url: str) -> int:
+        """Resolve a vanity URL to a Steam ID"""
+        response = APIConnection().call(
+            "ISteamUser", "ResolveVanityURL", "v0001", vanityurl=vanity_url
+        )
+        if response.success != 1:
+            raise UserNotFoundError(f"Failed to resolve vanity URL: {vanity_url}")
+        return int(response.steamid)
+
+    async def resolve_user_id(self, user_id: Union[int, str]) -> int:
+        """Resolve a Steam ID or vanity URL to a Steam ID"""
+        if isinstance(user_id, int) or search.is_steam_id(user_id):
+            return int(user_id)
         try:
-            if isinstance(user_id, int) or STEAM_ID_REGEX.fullmatch(user_id):
-                steam_user = SteamUser(userid=int(user_id))
-            else:
-                steam_user = SteamUser(userurl=user_id)
-            ban_date = None
-            if steam_user.is_game_banned or steam_user.is_vac_banned:
-                ban_date = datetime.utcnow() - timedelta(
-                    days=steam_user.days_since_last_ban
-                )
-            return steam_user.steamid, steam_user.name, ban_date
+            async with self._steam_api_semaphore:
+                return await run_in_thread(self._resolve_vanity_url, user_id)
         except UserNotFoundError:
             LOGGER.error('Message="Failed to find user" UserID="%s"', user_id)
             raise
 
-    async def process_user_id(self, user_id: str, guild_ids: Sequence[int]):
-        user_id, user_name, ban_date = await run_in_thread(
-            self._get_steam_user, user_id
+    @staticmethod
+    def _get_player_names(user_ids: Sequence[int]) -> Dict[int, str]:
+        """Get the display name of up to STEAM_API_BATCH_SIZE users"""
+        response = APIConnection().call(
+            "ISteamUser",
+            "GetPlayerSummaries",
+            "v2",
+            steamids=",".join(str(u) for u in user_ids),
         )
+        return {int(player.steamid): player.personaname for player in response.players}
 
-        with self._session() as session:
-            db_user = session.query(User).filter(User.id == user_id).one_or_none()
-            if db_user is None:
+    @staticmethod
+    def _get_ban_dates(user_ids: Sequence[int]) -> Dict[int, Optional[datetime]]:
+        """Get the last ban date of up to STEAM_API_BATCH_SIZE users"""
+        response = APIConnection().call(
+            "ISteamUser",
+            "GetPlayerBans",
+            "v1",
+            steamids=",".join(str(u) for u in user_ids),
+        )
+        now = datetime.utcnow()
+        ban_dates = {}
+        for player in response.players:
+            ban_date = None
+            if player.VACBanned or player.NumberOfGameBans > 0:
+                ban_date = now - timedelta(days=player.DaysSinceLastBan)
+            ban_dates[int(player.SteamId)] = ban_date
+        return ban_dates
+
+    async def _fetch_batched(
+        self,
+        api_call: Callable[[Sequence[int]], Dict[int, T]],
+        user_ids: Sequence[int],
+    ) -> Dict[int, T]:
+        """Run a Steam API batch function over the IDs, fetching batches concurrently"""
+
+        async def fetch_batch(batch: Sequence[int]) -> Dict[int, T]:
+            async with self._steam_api_semaphore:
+                return await run_in_thread(api_call, batch)
+
+        results = await asyncio.gather(
+            *[
+                fetch_batch(batch)
+                for batch in _batches(user_ids, self.STEAM_API_BATCH_SIZE)
+            ],
+            return_exceptions=True,
+        )
+        dump_gathered_exceptions(f"calling {api_call.__name__}", results)
+        merged = {}
+        for result in results:
+            if not isinstance(result, BaseException):
+                merged.update(result)
+        return merged
+
+    async def fetch_ban_dates(
+        self, user_ids: Sequence[int]
+    ) -> Dict[int, Optional[datetime]]:
+        """Get the last ban date of each user"""
+        return await self._fetch_batched(self._get_ban_dates, user_ids)
+
+    async def fetch_steam_users(
+        self, user_ids: Collection[int]
+    ) -> Dict[int, SteamUserInfo]:
+        """
+        Look up Steam users in batches, re-using lookups younger than
+        STEAM_USER_CACHE_TTL. Users that could not be found are left out.
+        """
+        now = time.monotonic()
+        steam_users = {}
+        for user_id in user_ids:
+            cached = self._steam_user_cache.get(user_id)
+            if cached is not None and now - cached[0] < self.STEAM_USER_CACHE_TTL:
+                steam_users[user_id] = cached[1]
+
+        if missing := [u for u in user_ids if u not in steam_users]:
+            # Drop expired lookups before adding new ones, so the cache only
+            # holds the users looked up within the last STEAM_USER_CACHE_TTL
+            self._steam_user_cache = {
+                user_id: cached
+                for user_id, cached in self._steam_user_cache.items()
+                if now - cached[0] < self.STEAM_USER_CACHE_TTL
+            }
+            names, ban_dates = await asyncio.gather(
+                self._fetch_batched(self._get_player_names, missing),
+                self.fetch_ban_dates(missing),
+            )
+            for user_id in missing:
+                if user_id not in names or user_id not in ban_dates:
+                    LOGGER.error('Message="Failed to find user" UserID="%s"', user_id)
+                    continue
+                steam_user = (user_id, names[user_id], ban_dates[user_id])
+                self._steam_user_cache[user_id] = (now, steam_user)
+                steam_users[user_id] = steam_user
+        return steam_users
+
+    @staticmethod
+    def _store_users(
+        session: Session,
+        steam_users: Sequence[SteamUserInfo],
+        guild_ids: Mapping[int, Sequence[int]],
+    ):
+        """Add or update users and link them to their guilds, loading rows in bulk"""
+        db_users: Dict[int, User] = {}
+        for batch in _batches([u for u, _, _ in steam_users], SQLITE_MAX_PARAMETERS):
+            db_users.update(
+                (u.id, u)
+                for u in session.query(User)
+                .options(selectinload(User.servers))
+                .filter(User.id.in_(batch))
+            )
+        all_guild_ids = {g for g_ids in guild_ids.values() for g in g_ids}
+        guilds = {
+            g.id: g for g in session.query(Guild).filter(Guild.id.in_(all_guild_ids))
+        }
+
+        for user_id, user_name, ban_date in steam_users:
+            if (db_user := db_users.get(user_id)) is None:
                 db_user = User(id=user_id, name=user_name)
+                session.add(db_user)
             db_user.date_banned = ban_date
 
-            guilds = session.query(Guild).filter(Guild.id.in_(guild_ids)).all()
-            db_user.servers.extend(guilds)
-            session.add(db_user)
-            session.commit()
-
-            LOGGER.info('Message="Processed user" User="%s"', db_user.id)
-            asyncio.create_task(self.check_ban(db_user.id, guild_ids))
+            # Only append the guild links we don't already have
+            new_guild_ids = set(guild_ids[user_id]).difference(
+                g.id for g in db_user.servers
+            )
+            db_user.servers.extend(guilds[g] for g in new_guild_ids if g in guilds)
+            LOGGER.info('Message="Processed user" User="%s"', user_id)
 
     @staticmethod
     def ban_status_changed(source: Optional[datetime], comparison: Optional[datetime]) -> bool:
@@ -224,15 +545,41 @@ class BanChecker(discord.Client):
             return True
         return comparison.date() > source.date()
 
-    async def check_ban(self, user_id: int, guild_ids: Sequence[int] = None):
-        LOGGER.debug('Message="Checking user for bans" UserID="%s"', user_id)
+    async def update_ban_dates(
+        self,
+        ban_dates: Mapping[int, Optional[datetime]],
+    ):
+        """Store changed ban dates, notifying each channel once per batch"""
         with self._session() as session:
-            user = session.query(User).filter(User.id == user_id).one_or_none()
-            _, _, ban_date = await run_in_thread(self._get_steam_user, user.id)
-
+            users: Dict[int, User] = {}
+            for batch in _batches(list(ban_dates), SQLITE_MAX_PARAMETERS):
+                users.update(
+                    (u.id, u)
+                    for u in session.query(User)
+                    .options(selectinload(User.servers))
+                    .filter(User.id.in_(batch))
+                )
+            notifications = self._apply_ban_dates(users, ban_dates)
+            session.commit()
+        # The session is closed before any Discord requests are awaited
+        await self._send_ban_notifications(notifications)
+
+    def _apply_ban_dates(
+        self,
+        users: Mapping[int, User],
+        ban_dates: Mapping[int, Optional[datetime]],
+    ) -> Dict[int, Sequence[discord.Embed]]:
+        """Update changed ban dates, returning the embeds to send to each channel"""
+        banned_users: Mapping[int, List[User]] = defaultdict(list)
+        for user_id, ban_date in ban_dates.items():
             if ban_date is None:
                 LOGGER.info('Message="User has not been banned" UserID="%s"', user_id)
-                return
+                continue
+
+            user = users.get(user_id)
+            if user is None:
+                LOGGER.warning('Message="User not stored" UserID="%s"', user_id)
+                continue
 
             if not self.ban_status_changed(user.date_banned, ban_date):
                 LOGGER.info(
@@ -240,62 +587,118 @@ class BanChecker(discord.Client):
                     user_id,
                     user.date_banned,
                 )
-                return
+                continue
 
-            LOGGER.warning(
-                'Message="User has been banned" UserID="%s" BanDate="%s"',
-                user_id,
-                user.date_banned,
+            user.date_banned = ban_date.replace(
+                hour=0, minute=0, second=0, microsecond=0
             )
 
-            user.date_banned = ban_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            session.add(user)
-            session.commit()
-
             LOGGER.warning(
                 'Message="User has been banned" UserID="%s" BanDate="%s"',
                 user_id,
                 user.date_banned,
             )
 
-            channels: Sequence[discord.TextChannel] = await asyncio.gather(
-                *[
-                    self.fetch_channel(g.channel)
-                    for g in user.servers
-                    if not guild_ids or guild_ids and g.id in guild_ids
-                ]
+            for guild in user.servers:
+                if guild.channel is not None:
+                    banned_users[guild.channel].append(user)
+
+        # Build the embeds before the caller commits, which would expire the
+        # users and reload each one on access
+        now = datetime.utcnow()
+        return {
+            channel: self._build_ban_embeds(channel_users, now)
+            for channel, channel_users in banned_users.items()
+        }
+
+    async def _send_ban_notifications(
+        self, notifications: Mapping[int, Sequence[discord.Embed]]
+    ):
+        if not notifications:
+            return
+        # A deleted or inaccessible channel mustn't stop the other channels'
+        # notifications, the bans have already been committed
+        results = await asyncio.gather(
+            *[self._notify_channel(c, e) for c, e in notifications.items()],
+            return_exceptions=True,
+        )
+        dump_gathered_exceptions("looking up ban notification channels", results)
+
+    async def _notify_channel(self, channel_id: int, embeds: Sequence[discord.Embed]):
+        """Send a channel its embeds, a failed send doesn't stop the others"""
+        channel = await self._get_channel(channel_id)
+        results = await asyncio.gather(
+            *[self._send_embed(channel, e) for e in embeds], return_exceptions=True
+        )
+        dump_gathered_exceptions(
+            f"sending ban notifications to channel {channel_id}", results
+        )
+
+    async def _get_channel(self, channel_id: int) -> discord.abc.GuildChannel:
+        """Get a channel from the gateway cache, only falling back to the API"""
+        channel = self.get_channel(channel_id)
+        if channel is None:
+            channel = await self.fetch_channel(channel_id)
+        return channel
+
+    async def _send_embed(self, channel: discord.TextChannel, embed: discord.Embed):
+        async with self._discord_send_semaphore:
+            await channel.send(embed=embed)
+
+    @staticmethod
+    def _build_ban_embeds(
+        users: Sequence[User], now: datetime
+    ) -> Sequence[discord.Embed]:
+        """Build the notification embeds for a channel's newly banned users"""
+        if len(users) == 1:
+            user = users[0]
+            embed = discord.Embed(
+                title=f"{user.name} was last banned {user.time_since_last_ban(now=now)} ago",
+                color=discord.Color.red(),
             )
-            message = discord.Embed(
-                title=f"{user.name} was last banned {user.time_since_last_ban()} ago",
+            embed.description = _profile_links(user.id)
+            return [embed]
+
+        embeds = []
+        for i in range(0, len(users), EMBED_MAX_FIELDS):
+            embed = discord.Embed(
+                title=f"{len(users)} players have been banned",
                 color=discord.Color.red(),
             )
-            message.description = f"""\
-[View their profile on Steam](https://steamcommunity.com/profiles/{user.id})
-[View their profile on CSGO Stats](https://csgostats.gg/player/{user.id})
-"""
-        await asyncio.gather(*[c.send(embed=message) for c in channels])
+            for user in users[i : i + EMBED_MAX_FIELDS]:
+                embed.add_field(
+                    name=f"{user.name} was last banned {user.time_since_last_ban(now=now)} ago",
+                    value=_profile_links(user.id),
+                    inline=False,
+                )
+            embeds.append(embed)
+        return embeds
 
     async def check_bans_task(self):
         """check bans task"""
-        hour = datetime.utcnow().hour
+        # Shard users by ID so each run checks a stable 1/CHECK_INTERVAL of them
+        # without the COUNT and OFFSET scans
+        shard = datetime.utcnow().hour % self.CHECK_INTERVAL
         with self._session() as session:
-            total_users = session.query(User.id).count()
-            batch_size = ceil(total_users / self.CHECK_INTERVAL)
-            users = (
-                session.query(User.id).limit(batch_size).offset(batch_size * hour).all()
-            )
-            await asyncio.gather(*[self.check_ban(u[0]) for u in users])
+            user_ids = [
+                u
+                for u, in session.query(User.id).filter(
+                    User.id % self.CHECK_INTERVAL == shard
+                )
+            ]
+        if not user_ids:
+            return
+
+        await self.update_ban_dates(await self.fetch_ban_dates(user_ids))
 
     async def send_stats(self, guild_id: int):
         with self._session() as session:
-            total_count = session.query(func.count(User.id)).scalar()
-            banned_count = (
-                session.query(func.count(User.id))
-                .filter(User.date_banned.isnot(None))
-                .scalar()
-            )
+            # COUNT(column) skips NULLs, so both counts come from one table scan
+            total_count, banned_count = session.query(
+                func.count(User.id), func.count(User.date_banned)
+            ).one()
             guild = session.query(Guild).filter(Guild.id == guild_id).one_or_none()
-            channel: discord.TextChannel = await self.fetch_channel(guild.channel)
+            channel: discord.TextChannel = await self._get_channel(guild.channel)
             if total_count == 0:
                 message = "No players are being tracked."
             else:
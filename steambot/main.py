@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 
@@ -21,6 +22,15 @@ def main():
     database = os.environ.get("DATABASE", "/data/steam_ban_checker.db")
     if os.path.isdir(database):
         database = os.path.join(database, "steam_ban_checker.db")
+    try:
+        import uvloop  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        LOGGER.info("uvloop not installed, using the default event loop")
+    else:
+        # Create the loop explicitly, newer uvloop releases don't create one
+        # implicitly in get_event_loop()
+        asyncio.set_event_loop(uvloop.new_event_loop())
+        LOGGER.info("Using uvloop event loop")
     aioutils.install()
     checker = BanChecker(database, steam_token, discord_token)
     checker.run()
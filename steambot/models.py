@@ -1,18 +1,49 @@
 from datetime import datetime, timedelta
 from typing import Optional, Union
 
-import humanfriendly
-from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey
+import sqlalchemy as sa
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    String,
+    DateTime,
+    Table,
+    ForeignKey,
+)
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+# Steam IDs and Discord snowflakes need 64 bits, SQLite's INTEGER already has
+# them and only "INTEGER PRIMARY KEY" columns alias the rowid
+_BigID = BigInteger().with_variant(Integer, "sqlite")
+
+_TIME_UNITS = (
+    ("year", 60 * 60 * 24 * 7 * 52),
+    ("week", 60 * 60 * 24 * 7),
+    ("day", 60 * 60 * 24),
+    ("hour", 60 * 60),
+    ("minute", 60),
+)
+
+
+def _format_timespan(seconds: float) -> str:
+    """Format a timespan as its largest whole unit (e.g.: "3 weeks")"""
+    for unit, unit_seconds in _TIME_UNITS:
+        if (count := int(seconds // unit_seconds)) > 0:
+            return f"{count} {unit}" if count == 1 else f"{count} {unit}s"
+    text = f"{seconds:.2f}".rstrip("0").rstrip(".")
+    return f"{text} second" if text == "1" else f"{text} seconds"
+
+
 _join_table = Table(
     "user_guild",
     Base.metadata,
-    Column("guild_id", Integer, ForeignKey("guild.id")),
-    Column("user_id", Integer, ForeignKey("user.id")),
+    Column("guild_id", _BigID, ForeignKey("guild.id"), primary_key=True),
+    Column("user_id", _BigID, ForeignKey("user.id"), primary_key=True, index=True),
 )
 
 
@@ -20,9 +51,9 @@ class Guild(Base):
 
     __tablename__ = "guild"
 
-    id = Column(Integer, primary_key=True)
+    id = Column(_BigID, primary_key=True, autoincrement=False)
     command = Column(String(length=1), nullable=False, default="!")
-    channel = Column(Integer)
+    channel = Column(_BigID)
     users = relationship("User", secondary=_join_table)
 
 
@@ -30,20 +61,59 @@ class User(Base):
 
     __tablename__ = "user"
 
-    id = Column(Integer, primary_key=True)
+    id = Column(_BigID, primary_key=True, autoincrement=False)
     name = Column(String, nullable=False)
     date_added = Column(DateTime, nullable=False, default=datetime.utcnow)
-    date_banned = Column(DateTime)
+    date_banned = Column(DateTime, index=True)
     servers = relationship("Guild", secondary=_join_table)
 
     def time_since_last_ban(
-        self, as_str: bool = True
+        self, as_str: bool = True, *, now: Optional[datetime] = None
     ) -> Optional[Union[timedelta, str]]:
         if self.date_banned is None:
             return None
-        time_since_last_ban = datetime.utcnow() - self.date_banned
+        # Callers formatting many users can pass one "now" for all of them
+        time_since_last_ban = (now or datetime.utcnow()) - self.date_banned
         if not as_str:
             return time_since_last_ban
-        return humanfriendly.format_timespan(
-            time_since_last_ban.total_seconds(), max_units=1
+        return _format_timespan(time_since_last_ban.total_seconds())
+
+
+class VanityURL(Base):
+
+    __tablename__ = "vanity_url"
+
+    url = Column(String, primary_key=True)
+    user_id = Column(_BigID, ForeignKey("user.id"), nullable=False)
+    date_resolved = Column(DateTime, default=datetime.utcnow)
+
+
+def migrate(engine: Engine):
+    """Bring tables created by older versions up to date with the models"""
+    inspector = sa.inspect(engine)
+    user_guild_indexes = {i["name"] for i in inspector.get_indexes("user_guild")}
+    vanity_url_columns = {c["name"] for c in inspector.get_columns("vanity_url")}
+    with engine.begin() as conn:
+        if "date_resolved" not in vanity_url_columns:
+            # Rows saved before this column existed are treated as expired
+            conn.execute("ALTER TABLE vanity_url ADD COLUMN date_resolved DATETIME")
+        if (
+            not inspector.get_pk_constraint("user_guild")["constrained_columns"]
+            and "ix_user_guild_guild_id_user_id" not in user_guild_indexes
+        ):
+            # SQLite can't add a primary key to an existing table, so drop any
+            # duplicate links and enforce uniqueness with an index instead
+            conn.execute(
+                "DELETE FROM user_guild WHERE rowid NOT IN "
+                "(SELECT MIN(rowid) FROM user_guild GROUP BY guild_id, user_id)"
+            )
+            conn.execute(
+                "CREATE UNIQUE INDEX ix_user_guild_guild_id_user_id "
+                "ON user_guild (guild_id, user_id)"
+            )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_user_guild_user_id ON user_guild (user_id)"
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_user_date_banned ON "user" (date_banned)'
         )
@@ -1,22 +1,42 @@
 import re
 from typing import Sequence
 
-STEAM_ID_REGEX = re.compile(r"([1-9][0-9]*)")
-USERNAME_REGEX = re.compile(r"([a-zA-Z[0-9]+)")
+# SteamID64s are at most 20 digits and vanity names are 2-32 characters long
+STEAM_ID_REGEX = re.compile(r"([1-9][0-9]{0,19})")
+USERNAME_REGEX = re.compile(r"([A-Za-z0-9_-]{2,32})")
+_QUICK_REGEXES = (STEAM_ID_REGEX, USERNAME_REGEX)
 
-COMMUNITY_URL_REGEX = re.compile(r"http(?:|s)://steamcommunity\.com/id/([^/]*)")
-PROFILE_URL_REGEX = re.compile(r"http(?:|s)://steamcommunity\.com/profiles/([1-9][0-9]*)[/]*")
-CSGO_STATS_REGEX = re.compile(r"http(?:|s)://csgostats\.gg/player/([1-9][0-9]*)[/#]*")
+# Steam community vanity/profile URLs and CSGO Stats URLs in one alternation,
+# so a message is scanned once and the shared https?:// prefix is matched once.
+# Numeric URLs only match SteamID64s, anything else must not be resolved as a
+# vanity name.
+USER_URL_REGEX = re.compile(
+    r"http(?:|s)://(?:"
+    r"steamcommunity\.com/id/(?P<community>[A-Za-z0-9_-]+)"
+    r"|steamcommunity\.com/profiles/(?P<profile>7[0-9]{16})(?![0-9])[/]*"
+    r"|csgostats\.gg/player/(?P<csgo_stats>7[0-9]{16})(?![0-9])[/#]*"
+    r")"
+)
+# Every USER_URL_REGEX match contains one of these, substring checks are far
+# cheaper than running the regex over chat that has no links
+_URL_MARKERS = ("steamcommunity.com", "csgostats.gg")
+
+
+def is_steam_id(string: str) -> bool:
+    """Check if a string is a SteamID64 (17 digits, starting with 7)"""
+    return len(string) == 17 and string.isdigit() and string[0] == "7"
 
 
 def find_user_ids_in_string(string: str, full_check: bool = True) -> Sequence[str]:
-    """Find user IDs in """
+    """Find unique user IDs in a string, in the order they first appear"""
     if full_check:
-        regexes = [COMMUNITY_URL_REGEX, PROFILE_URL_REGEX, CSGO_STATS_REGEX]
-    else:
-        regexes = [STEAM_ID_REGEX, USERNAME_REGEX]
+        if not any(m in string for m in _URL_MARKERS):
+            return []
+        return list(
+            dict.fromkeys(m.group(m.lastgroup) for m in USER_URL_REGEX.finditer(string))
+        )
 
     user_ids = []
-    for regex in regexes:
+    for regex in _QUICK_REGEXES:
         user_ids += regex.findall(string)
-    return user_ids
+    return list(dict.fromkeys(user_ids))